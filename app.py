@@ -1,10 +1,16 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
-import plotly.graph_objects as go
-from datetime import datetime, timedelta
 import numpy as np
-import scipy.stats as si
+import math
+import logging
+import os
+import re
+import time
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from bs_kernel import black_scholes_delta
 
 # --- 1. 页面配置 ---
 st.set_page_config(
@@ -15,7 +21,7 @@ st.set_page_config(
 )
 
 # --- 2. 自定义 CSS ---
-st.markdown("""
+STYLE = """
 <style>
     .metric-card { background-color: #1E1E1E; border: 1px solid #333; padding: 20px; border-radius: 10px; margin-bottom: 10px; }
     thead tr th:first-child {display:none}
@@ -24,198 +30,311 @@ st.markdown("""
     .sell-leg { background-color: #3d0000; color: #ff9999; border-left: 3px solid #ff4b4b; }
     .buy-leg { background-color: #002b00; color: #99ffbb; border-left: 3px solid #00cc96; }
 </style>
-""", unsafe_allow_html=True)
+"""
 
-# --- 3. 量化核心引擎 ---
+# 固定样式只注入一次，缓存命中时由 Streamlit 回放
+@st.cache_resource
+def inject_style():
+    st.markdown(STYLE, unsafe_allow_html=True)
 
-def black_scholes_delta(S, K, T, r, sigma, option_type='call'):
-    if T <= 0 or sigma <= 0: return 0
-    try:
-        d1 = (np.log(S / K) + (r + 0.5 * sigma ** 2) * T) / (sigma * np.sqrt(T))
-        if option_type == 'call': return si.norm.cdf(d1)
-        else: return si.norm.cdf(d1) - 1.0
-    except:
-        return 0 # 计算出错返回0
+inject_style()
+
+# --- 3. 量化核心引擎 ---
 
-def process_chain(df, current_price, days_to_exp, type, risk_free_rate=0.045):
+def process_chain(df, current_price, days_to_exp, type, lower, upper, risk_free_rate=0.045):
     T = days_to_exp / 365.0
-    df['type'] = type
+    # 基础范围过滤放在最前，只为扫描范围内的行计算 Delta
+    df = df[(df['strike'] >= lower) & (df['strike'] <= upper)].assign(type=type)
     # 填充缺失值，防止报错
     df['impliedVolatility'] = df['impliedVolatility'].fillna(0)
-    df['openInterest'] = df['openInterest'].fillna(0)
     df['bid'] = df['bid'].fillna(0)
     
-    # 计算 Delta
-    df['delta'] = df.apply(lambda x: black_scholes_delta(current_price, x['strike'], T, risk_free_rate, x['impliedVolatility'], type), axis=1)
+    # 计算 Delta (整列一次调用)，无效行直接记 0
+    K = df['strike'].to_numpy(np.float64)
+    sigma = df['impliedVolatility'].to_numpy(np.float64)
+    delta = np.zeros(len(df))
+    valid = sigma > 0
+    if T > 0:
+        cdf = black_scholes_delta(current_price, K[valid], T, math.sqrt(T), risk_free_rate * T, sigma[valid])
+        delta[valid] = cdf if type == 'call' else cdf - 1.0
+    df['delta'] = delta.astype(np.float32)
     
-    # v16修改：不再进行严格过滤，保留所有数据，在策略层再筛
-    return df.copy()
+    # v16修改：不再进行流动性过滤，保留范围内所有数据，在策略层再筛
+    return df
 
 def get_earnings_date(ticker_obj):
     try:
         cal = ticker_obj.calendar
         if cal and 'Earnings Date' in cal: return cal['Earnings Date'][0]
         return None
-    except: return None
+    except Exception as e:
+        logging.debug("earnings date unavailable: %s", e)
+        return None
+
+# 结果列 (SoA)：各到期日的候选按列拼接，最后一次性构建 DataFrame
+RESULT_COLS = ['expiration_date', 'days_to_exp', 'desc', 'price_display', 'capital', 'roi', 'delta', 'breakeven', 'legs']
+
+# Ticker 对象 (及其 HTTP 会话) 跨重跑共享，只调用方法，不要修改它
+# Ticker 内部会记住到期日列表和财报日历，ttl 到期后重建，避免新挂牌的到期日查不到
+@st.cache_resource(max_entries=20, ttl=900, show_spinner=False)
+def get_ticker(symbol):
+    import yfinance as yf # 延迟导入，冷启动时先渲染页面
+    return yf.Ticker(symbol)
+
+# 到期日列表与策略参数无关，单独缓存
+# yfinance 限流/失败时返回空元组；抛出异常让 st.cache_data 不缓存这次结果，下次直接重试
+@st.cache_data(ttl=900)
+def fetch_expirations(ticker):
+    exps = get_ticker(ticker).options
+    if not exps: raise LookupError(f"no option expirations for {ticker}")
+    return exps
+
+# 本地磁盘缓存：进程重启后 TTL 内直接读本地文件，不再请求 Yahoo
+# 行情和期权链只走这一层缓存 (不再叠加内存 TTL)，最旧不超过 CACHE_TTL，与原来 5 分钟的刷新节奏一致
+CACHE_DIR = Path(__file__).parent / ".cache"
+CACHE_TTL = 300
+CACHE_MAX_FILES = 500
+
+def cache_name(key):
+    return re.sub(r'[^A-Za-z0-9._^=-]', '_', key)
+
+def is_empty(data):
+    if isinstance(data, tuple): return all(is_empty(d) for d in data)
+    return isinstance(data, pd.DataFrame) and data.empty
+
+def disk_cached(key, fn, ttl=CACHE_TTL):
+    path = CACHE_DIR / (cache_name(key) + ".pkl")
+    try:
+        if time.time() - path.stat().st_mtime < ttl: return pd.read_pickle(path)
+    except FileNotFoundError: pass
+    except Exception as e: logging.debug("disk cache %s unreadable: %s", key, e) # 文件损坏则重新下载
+    data = fn()
+    if is_empty(data): return data # 空结果 (代码错误/限流) 不落盘，下次直接重试
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp") # 先写临时文件再替换，并发线程/进程不会读到半个文件
+        pd.to_pickle(data, tmp)
+        os.replace(tmp, path)
+    except OSError as e: logging.debug("disk cache %s not written: %s", key, e)
+    return data
+
+# 删除过期文件，并只保留最新的 CACHE_MAX_FILES 个，防止 .cache/ 无限增长
+def prune_disk_cache():
+    now = time.time()
+    entries = []
+    for p in CACHE_DIR.glob("*"):
+        try: entries.append((p.stat().st_mtime, p))
+        except OSError: continue
+    entries.sort(reverse=True)
+    for i, (mtime, p) in enumerate(entries):
+        if i >= CACHE_MAX_FILES or now - mtime > CACHE_TTL:
+            try: p.unlink()
+            except OSError: pass
+
+# 手动刷新：删掉该代码的全部磁盘缓存
+def clear_disk_cache(ticker):
+    for p in CACHE_DIR.glob(cache_name(ticker) + "__*"):
+        try: p.unlink()
+        except OSError: pass
+
+# 策略只用到这几列；下载后立即裁掉其余列，隐含波动率降为 float32 (只用来算 Delta)
+# strike/bid/ask 保持 float64：它们原样显示或参与金额计算，float32 会把 33.33 变成 33.33000183105469、盈亏平衡 92.1 变成 92.09999990463257
+CHAIN_COLS = ['strike', 'bid', 'ask', 'impliedVolatility']
+CHAIN_DTYPES = {'impliedVolatility': np.float32}
+
+# 单个到期日的期权链单独缓存，可在不同策略/参数之间复用
+# 下载失败直接抛出，不会把失败结果写进缓存
+def fetch_chain(ticker, date):
+    def download():
+        opt = get_ticker(ticker).option_chain(date)
+        return opt.calls[CHAIN_COLS].astype(CHAIN_DTYPES), opt.puts[CHAIN_COLS].astype(CHAIN_DTYPES)
+    return disk_cached(f"{ticker}__chain_{date}", download)
+
+def try_fetch_chain(ticker, date):
+    try: return fetch_chain(ticker, date)
+    except Exception as e:
+        logging.debug("option chain %s %s failed: %s", ticker, date, e)
+        return None
 
 # --- 策略构建器 ---
 def build_spread(longs, shorts, width, type='credit'):
-    spreads = []
-    for _, s in shorts.iterrows():
-        target = s['strike'] - width if s['type']=='put' else s['strike'] + width
-        matches = longs[abs(longs['strike'] - target) < 0.5] # 放宽匹配容差
-        if not matches.empty:
-            l = matches.iloc[0]
-            net = s['bid'] - l['ask']
-            # 放宽价格限制，哪怕没肉也先显示出来，方便调试
-            loss = width - net
-            roi = net/loss if loss > 0 else 0
-            spreads.append({
-                'desc': f"SELL {s['type'].upper()} ${s['strike']} / BUY {l['type'].upper()} ${l['strike']}",
-                'price_display': net, 'capital': loss*100, 'roi': roi,
-                'delta': s['delta'] - l['delta'],
-                'breakeven': s['strike'] - net if s['type']=='put' else s['strike'] + net,
-                'legs': [{'side':'SELL', 'type':s['type'].upper(), 'strike':s['strike']}, {'side':'BUY', 'type':l['type'].upper(), 'strike':l['strike']}]
+    if shorts.empty or longs.empty: return pd.DataFrame()
+    t = shorts['type'].iloc[0].upper()
+    sign = -1 if t == 'PUT' else 1
+    # 买腿行权价排序一次，二分查找每条卖腿的目标行权价 (放宽匹配容差 0.5)
+    order = np.argsort(longs['strike'].to_numpy(), kind='stable')
+    l_strike = longs['strike'].to_numpy()[order]
+    target = shorts['strike'].to_numpy() + sign * width
+    i = np.minimum(np.searchsorted(l_strike, target - 0.5, side='right'), len(l_strike) - 1)
+    hit = np.abs(l_strike[i] - target) < 0.5
+    if not hit.any(): return pd.DataFrame()
+    s, l = shorts[hit], longs.iloc[order[i[hit]]]
+
+    # 放宽价格限制，哪怕没肉也先显示出来，方便调试
+    ss, ls = s['strike'].to_numpy(), l['strike'].to_numpy()
+    net = s['bid'].to_numpy() - l['ask'].to_numpy()
+    loss = width - net
+    res = pd.DataFrame({
+        'short_strike': ss, 'long_strike': ls,
+        'price_display': net, 'capital': loss*100, 'roi': np.divide(net, loss, out=np.zeros_like(net), where=loss > 0),
+        'delta': s['delta'].to_numpy() - l['delta'].to_numpy(),
+        'breakeven': ss + sign * net,
+        'legs': [[{'side':'SELL', 'type':t, 'strike':a}, {'side':'BUY', 'type':t, 'strike':b}] for a, b in zip(ss.tolist(), ls.tolist())]
+    })
+    # 描述列整列拼接，不再逐行 f-string
+    res['desc'] = f'SELL {t} $' + res['short_strike'].astype(str) + f' / BUY {t} $' + res['long_strike'].astype(str)
+    return res
+
+# 单个到期日：下载期权链 + 跑策略，返回该到期日的候选 (RESULT_COLS)；由线程池并发调用
+def scan_expiration(ticker, date, days, current_price, strat_code, spread_width, lower, upper):
+    opt = try_fetch_chain(ticker, date)
+    if opt is None: return None
+    try:
+        # 只处理策略会用到的一侧，另一侧直接跳过 (不算 Delta)
+        calls = process_chain(opt[0], current_price, days, 'call', lower, upper) if strat_code in ('CC', 'BEAR_CALL', 'IRON_CONDOR') else pd.DataFrame()
+        puts = process_chain(opt[1], current_price, days, 'put', lower, upper) if strat_code in ('CSP', 'BULL_PUT', 'IRON_CONDOR') else pd.DataFrame()
+
+        if calls.empty and puts.empty: return None
+
+        # === 策略逻辑 (带自动降级) ===
+
+        # 1. CSP (卖Put)
+        if strat_code == 'CSP':
+            # 尝试找 Delta 合适的
+            df = puts[(puts['delta'] > -0.4) & (puts['delta'] < -0.1)]
+            # 降级：如果没找到，直接找虚值的
+            if df.empty:
+                df = puts[puts['strike'] < current_price * 0.98]
+
+            k, bid = df['strike'], df['bid']
+            return pd.DataFrame({
+                'expiration_date': date, 'days_to_exp': days, 'desc': 'SELL PUT $' + k.astype(str),
+                'price_display': bid, 'capital': k*100, 'roi': (bid/k).where(k > 0, 0), 'delta': df['delta'],
+                'breakeven': '$' + (k - bid).map('{:.2f}'.format),
+                'legs': [[{'side':'SELL', 'type':'PUT', 'strike':x}] for x in k]
             })
-    return pd.DataFrame(spreads)
 
-@st.cache_data(ttl=300)
+        # 2. CC (卖Call)
+        elif strat_code == 'CC':
+            df = calls[(calls['delta'] < 0.4) & (calls['delta'] > 0.1)]
+            if df.empty: df = calls[calls['strike'] > current_price * 1.02]
+
+            k, bid = df['strike'], df['bid']
+            return pd.DataFrame({
+                'expiration_date': date, 'days_to_exp': days, 'desc': 'SELL CALL $' + k.astype(str),
+                'price_display': bid, 'capital': current_price*100, 'roi': bid/current_price, 'delta': df['delta'],
+                'breakeven': '$' + (current_price - bid).map('{:.2f}'.format),
+                'legs': [[{'side':'SELL', 'type':'CALL', 'strike':x}] for x in k]
+            })
+
+        # 3. 垂直价差 (Bull Put / Bear Call)
+        elif strat_code == 'BULL_PUT':
+            shorts = puts[(puts['delta'] > -0.5) & (puts['delta'] < -0.1)] # 放宽范围
+            if shorts.empty: shorts = puts[puts['strike'] < current_price]
+            res = build_spread(puts, shorts, spread_width, 'credit')
+            return res.assign(expiration_date=date, days_to_exp=days)
+
+        elif strat_code == 'BEAR_CALL':
+            shorts = calls[(calls['delta'] < 0.5) & (calls['delta'] > 0.1)]
+            if shorts.empty: shorts = calls[calls['strike'] > current_price]
+            res = build_spread(calls, shorts, spread_width, 'credit')
+            return res.assign(expiration_date=date, days_to_exp=days)
+
+        # 4. Iron Condor
+        elif strat_code == 'IRON_CONDOR':
+            p_s = puts[(puts['delta'] > -0.3) & (puts['delta'] < -0.1)]
+            c_s = calls[(calls['delta'] < 0.3) & (calls['delta'] > 0.1)]
+            if p_s.empty: p_s = puts[(puts['strike'] < current_price*0.95)]
+            if c_s.empty: c_s = calls[(calls['strike'] > current_price*1.05)]
+
+            p_spr = build_spread(puts, p_s, spread_width, 'credit')
+            c_spr = build_spread(calls, c_s, spread_width, 'credit')
+
+            if not p_spr.empty and not c_spr.empty:
+                # Put/Call 两翼做笛卡尔积，整列计算
+                ic = p_spr.head(5).merge(c_spr.head(5), how='cross', suffixes=('_p', '_c'))
+                ps, cs = ic['short_strike_p'], ic['short_strike_c']
+                net = ic['price_display_p'] + ic['price_display_c']
+                loss = spread_width - net
+                ic = pd.DataFrame({
+                    'expiration_date': date, 'days_to_exp': days,
+                    'desc': 'IC Put $' + ps.astype(str) + ' / Call $' + cs.astype(str),
+                    'price_display': net, 'capital': loss*100, 'roi': (net/loss).where(loss > 0, 0),
+                    'delta': ic['delta_p'] + ic['delta_c'],
+                    'breakeven': '$' + (ps - net).map('{:.1f}'.format) + '/$' + (cs + net).map('{:.1f}'.format),
+                    'legs': ic['legs_p'] + ic['legs_c']
+                })
+                return ic
+    except (KeyError, IndexError, ValueError, TypeError) as e:
+        logging.debug("skip %s %s: %s", ticker, date, e)
+    return None
+
+# K线历史与策略参数无关，按代码单独缓存，切换战术/价差宽度不会重新下载
+# 图表直接用 fetch_market_data 返回的这份数据：渲染时不再请求 Yahoo，现价线也与 current_price 同源
+def fetch_history(ticker):
+    return disk_cached(f"{ticker}__history_1mo", lambda: get_ticker(ticker).history(period="1mo"))
+
+# 取不到行情/到期日、网络异常都直接抛出：st.cache_data 不缓存异常，下次重跑立即重试，由调用处转成错误提示
+@st.cache_data(ttl=300, max_entries=50)
 def fetch_market_data(ticker, strat_code, spread_width, strike_range_pct):
-    try:
-        stock = yf.Ticker(ticker)
-        history = stock.history(period="3mo") 
-        if history.empty: return None, 0, None, None, "无法获取股价数据，请检查代码是否正确或网络"
-        current_price = history['Close'].iloc[-1]
-        next_earnings = get_earnings_date(stock)
-        
-        expirations = stock.options
-        if not expirations: return None, current_price, history, next_earnings, "未获取到期权链，可能是非交易时间或数据源问题"
-
-        today = datetime.now().date()
-        date_map = []
-        for d_str in expirations:
-            try:
-                d_obj = datetime.strptime(d_str, "%Y-%m-%d").date()
-                days = (d_obj - today).days
-                date_map.append((d_str, days))
-            except: continue
-
-        all_opps = []
-        
-        # 简单的日期筛选逻辑
-        target_dates = []
-        for d_str, days in date_map:
-            # 放宽日期限制，只要没过期的都拿来看
-            if days >= 2: target_dates.append((d_str, days))
-
-        lower = current_price * (1 - strike_range_pct/100)
-        upper = current_price * (1 + strike_range_pct/100)
-
-        for date, days in target_dates:
-            try:
-                opt = stock.option_chain(date)
-                calls = process_chain(opt.calls, current_price, days, 'call')
-                puts = process_chain(opt.puts, current_price, days, 'put')
-                
-                # 基础范围过滤
-                calls = calls[(calls['strike'] >= lower) & (calls['strike'] <= upper)]
-                puts = puts[(puts['strike'] >= lower) & (puts['strike'] <= upper)]
-
-                if calls.empty and puts.empty: continue
-
-                # === 策略逻辑 (带自动降级) ===
-                
-                # 1. CSP (卖Put)
-                if strat_code == 'CSP':
-                    # 尝试找 Delta 合适的
-                    df = puts[(puts['delta'] > -0.4) & (puts['delta'] < -0.1)]
-                    # 降级：如果没找到，直接找虚值的
-                    if df.empty:
-                        df = puts[puts['strike'] < current_price * 0.98]
-                    
-                    for _, r in df.iterrows():
-                        all_opps.append({
-                            'expiration_date': date, 'days_to_exp': days, 'desc': f"SELL PUT ${r['strike']}",
-                            'price_display': r['bid'], 'capital': r['strike']*100, 'roi': r['bid']/r['strike'] if r['strike']>0 else 0,
-                            'delta': r['delta'], 'breakeven': f"${r['strike']-r['bid']:.2f}",
-                            'legs': [{'side':'SELL', 'type':'PUT', 'strike':r['strike']}]
-                        })
-
-                # 2. CC (卖Call)
-                elif strat_code == 'CC':
-                    df = calls[(calls['delta'] < 0.4) & (calls['delta'] > 0.1)]
-                    if df.empty: df = calls[calls['strike'] > current_price * 1.02]
-                    
-                    for _, r in df.iterrows():
-                        all_opps.append({
-                            'expiration_date': date, 'days_to_exp': days, 'desc': f"SELL CALL ${r['strike']}",
-                            'price_display': r['bid'], 'capital': current_price*100, 'roi': r['bid']/current_price,
-                            'delta': r['delta'], 'breakeven': f"${current_price-r['bid']:.2f}",
-                            'legs': [{'side':'SELL', 'type':'CALL', 'strike':r['strike']}]
-                        })
-
-                # 3. 垂直价差 (Bull Put / Bear Call)
-                elif strat_code == 'BULL_PUT':
-                    shorts = puts[(puts['delta'] > -0.5) & (puts['delta'] < -0.1)] # 放宽范围
-                    if shorts.empty: shorts = puts[puts['strike'] < current_price]
-                    res = build_spread(puts, shorts, spread_width, 'credit')
-                    for _, r in res.iterrows():
-                        r.update({'expiration_date': date, 'days_to_exp': days})
-                        all_opps.append(r)
-
-                elif strat_code == 'BEAR_CALL':
-                    shorts = calls[(calls['delta'] < 0.5) & (calls['delta'] > 0.1)]
-                    if shorts.empty: shorts = calls[calls['strike'] > current_price]
-                    res = build_spread(calls, shorts, spread_width, 'credit')
-                    for _, r in res.iterrows():
-                        r.update({'expiration_date': date, 'days_to_exp': days})
-                        all_opps.append(r)
-
-                # 4. Iron Condor
-                elif strat_code == 'IRON_CONDOR':
-                    p_s = puts[(puts['delta'] > -0.3) & (puts['delta'] < -0.1)]
-                    c_s = calls[(calls['delta'] < 0.3) & (calls['delta'] > 0.1)]
-                    if p_s.empty: p_s = puts[(puts['strike'] < current_price*0.95)]
-                    if c_s.empty: c_s = calls[(calls['strike'] > current_price*1.05)]
-                    
-                    p_spr = build_spread(puts, p_s, spread_width, 'credit')
-                    c_spr = build_spread(calls, c_s, spread_width, 'credit')
-                    
-                    if not p_spr.empty and not c_spr.empty:
-                        p_list = p_spr.head(5).to_dict('records')
-                        c_list = c_spr.head(5).to_dict('records')
-                        for p in p_list:
-                            for c in c_list:
-                                net = p['price_display'] + c['price_display']
-                                loss = spread_width - net
-                                all_opps.append({
-                                    'expiration_date': date, 'days_to_exp': days,
-                                    'desc': f"IC Put ${p['legs'][0]['strike']} / Call ${c['legs'][0]['strike']}",
-                                    'price_display': net, 'capital': loss*100, 'roi': net/loss if loss>0 else 0,
-                                    'delta': p['delta'] + c['delta'], 
-                                    'breakeven': f"${p['legs'][0]['strike']-net:.1f}/${c['legs'][0]['strike']+net:.1f}",
-                                    'legs': p['legs'] + c['legs']
-                                })
-
-            except Exception: continue
-
-        if not all_opps: return None, current_price, history, next_earnings, "策略匹配为空（建议放宽扫描范围）"
-        df = pd.DataFrame(all_opps)
-        # 统一计算年化
-        df['annualized_return'] = df.apply(lambda x: x['roi'] * (365/x['days_to_exp']) if x['roi']>0 and x['days_to_exp']>0 else 0, axis=1)
-        return df, current_price, history, next_earnings, None
-
-    except Exception as e: return None, 0, None, None, f"API 错误: {str(e)}"
+    prune_disk_cache()
+    stock = get_ticker(ticker)
+    history = fetch_history(ticker)
+    if history.empty: raise LookupError("无法获取股价数据，请检查代码是否正确或网络")
+    current_price = history['Close'].iloc[-1]
+    next_earnings = get_earnings_date(stock)
+    
+    try: expirations = fetch_expirations(ticker)
+    except LookupError: raise LookupError("未获取到期权链，可能是非交易时间或数据源问题") from None
+
+    # 到期日 (YYYY-MM-DD) 直接转 datetime64[D]，一次相减得到剩余天数
+    today = np.datetime64(pd.Timestamp.today().date(), 'D')
+    exp_arr = np.array(expirations, dtype='datetime64[D]')
+    days_arr = (exp_arr - today).astype(int)
+
+    # 简单的日期筛选逻辑 (布尔掩码)
+    # 放宽日期限制，只要没过期的都拿来看
+    mask = days_arr >= 2
+    target_dates = list(zip(np.asarray(expirations)[mask].tolist(), days_arr[mask].tolist()))
+
+    lower = current_price * (1 - strike_range_pct/100)
+    upper = current_price * (1 + strike_range_pct/100)
+
+    # 各到期日的期权链是独立的 HTTP 请求，下载与策略计算一起放进线程池并发执行
+    with ThreadPoolExecutor(max_workers=max(1, min(len(target_dates), 16))) as ex:
+        frames = list(ex.map(lambda d: scan_expiration(ticker, d[0], d[1], current_price, strat_code, spread_width, lower, upper),
+                             target_dates))
+
+    frames = [f for f in frames if f is not None and not f.empty]
+    if not frames: return None, current_price, history, next_earnings, "策略匹配为空（建议放宽扫描范围）"
+    # 每列一次 np.concatenate 写入预分配的数组，不经过 Python 列表和 pd.concat 的块合并
+    data = {k: np.concatenate([f[k].to_numpy() for f in frames]) for k in RESULT_COLS}
+    # 统一计算年化 (整列)，构建与派生列一次完成
+    df = pd.DataFrame(data, copy=False).assign(
+        annualized_return=lambda d: np.where((d['roi'] > 0) & (d['days_to_exp'] > 0), d['roi'] * 365 / d['days_to_exp'], 0)
+    )
+    return df, current_price, history, next_earnings, None
 
 def render_chart(history_df, ticker, r):
-    fig = go.Figure(data=[go.Candlestick(x=history_df.index, open=history_df['Open'], high=history_df['High'], low=history_df['Low'], close=history_df['Close'], name=ticker)])
-    cp = history_df['Close'].iloc[-1]
-    fig.add_hline(y=cp, line_dash="dot", line_color="gray", annotation_text="现价")
+    # K线底图 (蜡烛 + 现价线 + 布局) 按 (代码, 最后一根K线) 存进 session_state，重跑时只替换行权价标记线
+    # 盘中当天K线会更新，键里带上最后一根的 OHLC，行情刷新后重画底图
+    key = (ticker, len(history_df), history_df.index[-1], tuple(history_df.iloc[-1][['Open', 'High', 'Low', 'Close']].tolist()))
+    cached = st.session_state.get('chart')
+    if cached is None or cached[0] != key:
+        import plotly.graph_objects as go # 延迟导入，只有画图时才加载 plotly
+        fig = go.Figure(data=[go.Candlestick(x=history_df.index, open=history_df['Open'], high=history_df['High'], low=history_df['Low'], close=history_df['Close'], name=ticker)])
+        cp = history_df['Close'].iloc[-1]
+        fig.add_hline(y=cp, line_dash="dot", line_color="gray", annotation_text="现价")
+        fig.update_layout(height=350, margin=dict(l=20, r=20, t=20, b=20), xaxis_rangeslider_visible=False, template="plotly_dark")
+        cached = (key, fig, fig.layout.shapes)
+        st.session_state['chart'] = cached
+
+    _, fig, base_shapes = cached
+    fig.layout.shapes = base_shapes
     if 'legs' in r:
         for leg in r['legs']:
             col = "red" if "SELL" in leg['side'] else "green"
             fig.add_hline(y=leg['strike'], line_color=col, line_dash="dash")
-    fig.update_layout(height=350, margin=dict(l=20, r=20, t=20, b=20), xaxis_rangeslider_visible=False, template="plotly_dark")
     st.plotly_chart(fig, use_container_width=True)
 
 # --- 4. 界面渲染 ---
@@ -247,12 +366,17 @@ with st.sidebar:
     show_debug = st.checkbox("🐞 开启调试模式 (如果没数据请勾选)")
     
     if st.button("🚀 启动引擎", type="primary", use_container_width=True):
-        st.cache_data.clear()
+        # 强制刷新：丢掉该代码的磁盘缓存和扫描结果
+        clear_disk_cache(ticker)
+        fetch_expirations.clear()
+        fetch_market_data.clear()
 
 st.title(f"{ticker} 策略")
 
 with st.spinner(f'正在扫描 {s_name}...'):
-    df, current_price, history, next_earnings, err = fetch_market_data(ticker, strat_code, spread_width, strike_range_pct)
+    try: df, current_price, history, next_earnings, err = fetch_market_data(ticker, strat_code, spread_width, strike_range_pct)
+    except LookupError as e: df, current_price, history, next_earnings, err = None, 0, None, None, str(e)
+    except Exception as e: df, current_price, history, next_earnings, err = None, 0, None, None, f"API 错误: {str(e)}"
 
 if err:
     st.error(f"❌ 发生错误: {err}")
@@ -260,9 +384,8 @@ if err:
         st.info("可能是网络问题或 yfinance 数据源暂时不可用。请稍后再试。")
 else:
     if not df.empty:
-        # 排序逻辑
-        best = df.sort_values('annualized_return', ascending=False).head(1)
-        r = best.iloc[0]
+        # 取年化最高的一行 (O(N) 扫描，不做整表排序)
+        r = df.loc[df['annualized_return'].idxmax()]
 
         c1, c2 = st.columns([1.5, 1])
         with c1:
@@ -295,7 +418,7 @@ if show_debug:
     st.divider()
     st.markdown("### 🐞 调试面板")
     try:
-        stock = yf.Ticker(ticker)
+        stock = get_ticker(ticker)
         exps = stock.options
         st.write(f"1. 获取到的到期日: {exps}")
         if exps:
@@ -0,0 +1,14 @@
+import math
+
+import numba
+
+# Black-Scholes Delta 内核单独放在无副作用的模块里：
+# numba 的磁盘缓存 (cache=True) 按模块名记录，若放在 app.py 中，加载缓存会重新导入整个 Streamlit 页面
+
+# Numba ufunc：log/sqrt/erf 融合成一次遍历，cache=True 避免 Streamlit 重跑时重新编译
+# 内核不做分支，T<=0 / sigma<=0 的行由调用方先屏蔽
+# 只依赖到期日的 sqrt(T)、r*T 由调用方每条链算一次传入；返回 N(d1) 即 Call Delta，Put Delta = N(d1) - 1
+@numba.vectorize(['float64(float64, float64, float64, float64, float64, float64)'], cache=True, fastmath=True)
+def black_scholes_delta(S, K, T, sqrt_T, rT, sigma):
+    d1 = (math.log(S / K) + rT + 0.5 * sigma * sigma * T) / (sigma * sqrt_T)
+    return 0.5 * (1.0 + math.erf(d1 * 0.7071067811865476))
@@ -0,0 +1 @@
+# 让 pytest 把仓库根目录加入 sys.path，测试可以直接 import bs_kernel
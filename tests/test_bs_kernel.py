@@ -0,0 +1,42 @@
+import math
+
+import numpy as np
+
+from bs_kernel import black_scholes_delta
+
+
+def reference(S, K, T, r, sigma):
+    d1 = (math.log(S / K) + (r + 0.5 * sigma ** 2) * T) / (sigma * math.sqrt(T))
+    return 0.5 * (1.0 + math.erf(d1 / math.sqrt(2.0)))
+
+
+def call(S, K, T, r, sigma):
+    return black_scholes_delta(S, K, T, math.sqrt(T), r * T, sigma)
+
+
+def test_atm_matches_erf_reference():
+    S = K = 100.0
+    T, r, sigma = 30 / 365.0, 0.045, 0.35
+    assert math.isclose(call(S, K, T, r, sigma), reference(S, K, T, r, sigma), rel_tol=1e-12)
+    # ATM Call Delta 略高于 0.5
+    assert 0.5 < call(S, K, T, r, sigma) < 0.6
+
+
+def test_deep_itm_and_otm():
+    T, r, sigma = 30 / 365.0, 0.045, 0.3
+    itm = call(100.0, 50.0, T, r, sigma)
+    otm = call(100.0, 200.0, T, r, sigma)
+    assert math.isclose(itm, 1.0, abs_tol=1e-9)
+    assert math.isclose(otm, 0.0, abs_tol=1e-9)
+    assert math.isclose(itm, reference(100.0, 50.0, T, r, sigma), abs_tol=1e-12)
+
+
+def test_vectorized_over_strikes():
+    K = np.array([80.0, 90.0, 100.0, 110.0, 120.0])
+    sigma = np.full_like(K, 0.4)
+    T, r = 45 / 365.0, 0.045
+    out = black_scholes_delta(100.0, K, T, math.sqrt(T), r * T, sigma)
+    expected = [reference(100.0, k, T, r, 0.4) for k in K]
+    np.testing.assert_allclose(out, expected, rtol=1e-12)
+    # Call Delta 随行权价单调递减
+    assert np.all(np.diff(out) < 0)